@@ -1,27 +1,80 @@
 import streamlit as st
-import json
+import orjson
 import random
 from datetime import datetime, timedelta, timezone
 import os
-import requests
-import base64
-import re
+import queue
+import threading
+import itertools
+
+_HANOI_TZ = timezone(timedelta(hours=7))
 
 def format_question_with_code(text: str, lang: str = "javascript") -> str:
+    # One split pass: odd-indexed chunks sit between ``` fences and get
+    # rewritten with the skill's language tag; no regex engine involved
+    parts = text.split("```")
+    if len(parts) < 3:
+        return text
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2 == 1 and i != len(parts) - 1:
+            out.append(f"\n```{lang}\n{part.strip()}\n```")
+        elif i % 2 == 1:
+            # Unpaired trailing fence: restore it untouched
+            out.append("```" + part)
+        else:
+            out.append(part)
+    return "".join(out)
+
+
+@st.cache_data(max_entries=2048, show_spinner=False)
+def format_question_cached(text: str, lang: str) -> str:
+    # Question text is immutable, so repeated renders of the same question
+    # (wrong-answer reruns, fragment redraws) become a cache lookup
+    return format_question_with_code(f"❓ {text}", lang)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def results_table(items: tuple):
+    # st.table re-coerces a dict through pandas on every rerun of the
+    # summary screen; memoize the frame on the (skill, result) pairs
+    import pandas as pd
+
+    return pd.DataFrame(items, columns=["skill", "result"]).set_index("skill")
+
+
+@st.cache_resource
+def get_github_config():
+    # Resolve the secrets TOML once; uploads then use plain strings
+    return (st.secrets.github_username, st.secrets.github_repo, st.secrets.github_token)
+
+
+@st.cache_resource
+def get_github_session():
+    # Imported here so app cold start does not pay for the HTTP stack;
+    # nothing needs requests until the first upload
+    import requests
+    from requests.adapters import HTTPAdapter, Retry
+
+    # One pooled Session keeps the TLS connection to api.github.com alive
+    # across uploads instead of a full handshake per requests.put
+    gh = requests.Session()
+    gh.headers.update({"Accept": "application/vnd.github.v3+json"})
+    gh.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+        ),
+    )
+    return gh
 
-    code_blocks = re.findall(r"```(.*?)```", text, flags=re.DOTALL)
-    for block in code_blocks:
-        text = text.replace(
-            f"```{block}```",
-            f"\n```{lang}\n{block.strip()}\n```",
-        )
-    return text
 
-def save_to_github(account: str, skill: str, final_result: str, history: list, failed: bool):
+def save_to_github(account: str, skill: str, final_result: str, history: list, failed: bool, ts: str | None = None):
 
-    now_utc = datetime.now(timezone.utc)
-    hanoi_time = now_utc.astimezone(timezone(timedelta(hours=7)))
-    filename = f"{account}_{skill}_{hanoi_time.strftime('%Y%m%d_%H%M%S')}.json"
+    if ts is None:
+        ts = datetime.now(_HANOI_TZ).strftime("%Y%m%d_%H%M%S")
+    filename = f"{account}_{skill}_{ts}.json"
     file_path = f"results/{filename}"
 
     file_content = {
@@ -33,63 +86,210 @@ def save_to_github(account: str, skill: str, final_result: str, history: list, f
         "timestamp": datetime.now().isoformat(),
     }
 
-    content_str = json.dumps(file_content, indent=2, ensure_ascii=False)
-    content_b64 = base64.b64encode(content_str.encode()).decode()
+    import base64
 
-    url = (
-        f"https://api.github.com/repos/{st.secrets.github_username}/"
-        f"{st.secrets.github_repo}/contents/{file_path}"
-    )
+    # orjson serializes straight to UTF-8 bytes, so no str→bytes encode step
+    raw = orjson.dumps(file_content, option=orjson.OPT_INDENT_2)
+    content_b64 = base64.b64encode(raw).decode("ascii")
+
+    gh_user, gh_repo, gh_token = get_github_config()
+    url = f"https://api.github.com/repos/{gh_user}/{gh_repo}/contents/{file_path}"
 
     headers = {
-        "Authorization": f"Bearer {st.secrets.github_token}",
-        "Accept": "application/vnd.github.v3+json",
+        "Authorization": f"Bearer {gh_token}",
+        "Content-Type": "application/json",
     }
 
-    payload = {"message": f"Add {skill} result for {account}", "content": content_b64}
-    res = requests.put(url, headers=headers, json=payload)
-
-    if res.status_code in (200, 201):
-        st.success(f"Đã lưu kết quả *{skill}* tại results/{filename}")
-    else:
-        st.error(f"Không thể lưu kết quả *{skill}* lên GitHub. Chi tiết: {res.text}")
+    # Serialize the request body ourselves so requests does not re-walk the
+    # payload (including the full base64 content) through stdlib json
+    payload = orjson.dumps(
+        {"message": f"Add {skill} result for {account}", "content": content_b64}
+    )
+    res = get_github_session().put(url, headers=headers, data=payload, timeout=10)
+
+    # Runs on the save worker thread, so report failures by raising
+    # instead of calling st.* (no script run context there).
+    if res.status_code not in (200, 201):
+        raise RuntimeError(f"Không thể lưu kết quả *{skill}* lên GitHub. Chi tiết: {res.text}")
+
+
+def append_summary_jsonl(summary: dict) -> str:
+    # Compact one-line record appended with a single write syscall; the
+    # fallback log survives restarts without per-run files to manage
+    filepath = os.path.join("results", "summaries.jsonl")
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, orjson.dumps(summary, option=orjson.OPT_APPEND_NEWLINE))
+    finally:
+        os.close(fd)
+    return filepath
 
 
-def save_result_to_file(account: str, skill: str, result: dict) -> str:
+def save_result_to_file(account: str, skill: str, result: dict, ts: str | None = None) -> str:
 
-    os.makedirs("results", exist_ok=True)
     clean_account = account.strip().replace(" ", "_").lower()
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{clean_account}_{skill}_{timestamp}.json"
+    if ts is None:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"{clean_account}_{skill}_{ts}.json"
     filepath = os.path.join("results", filename)
 
-    with open(filepath, "w", encoding="utf-8") as f_out:
-        json.dump(result, f_out, indent=2, ensure_ascii=False)
+    with open(filepath, "wb") as f_out:
+        f_out.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
 
     return filepath
 
 
+@st.cache_resource
+def get_save_status():
+    # Written by the save workers, read by the summary screen on rerun;
+    # a plain dict because worker threads have no script run context
+    return {}
+
+
+@st.cache_resource
+def get_save_queue():
+    """Queue drained by a daemon worker so saves never block the UI."""
+    # Created once per process, so the idempotent mkdir happens here
+    # rather than on every save
+    os.makedirs("results", exist_ok=True)
+    save_q = queue.Queue()
+    status = get_save_status()
+
+    def _save_worker():
+        while True:
+            kind, args = save_q.get()
+            try:
+                if kind == "summary":
+                    # GitHub is the system of record; the local file is only
+                    # a fallback (results/ is ephemeral on Streamlit Cloud,
+                    # and writing both doubles the serialization work)
+                    account, skill, final_result, summary, failed, ts = args
+                    try:
+                        save_to_github(account, skill, final_result, summary, failed, ts)
+                        status[(account, ts)] = "github"
+                    except Exception as e:
+                        print(f"[save-worker] github save failed, keeping local copy: {e}")
+                        append_summary_jsonl(summary)
+                        status[(account, ts)] = f"local ({e})"
+            except Exception as e:
+                print(f"[save-worker] {kind} save failed: {e}")
+            finally:
+                save_q.task_done()
+
+    # Two drainers so the local write and the GitHub upload of one run
+    # proceed in parallel instead of queueing behind each other
+    for _ in range(2):
+        threading.Thread(target=_save_worker, daemon=True).start()
+    return save_q
+
+
+# Every question has four options, so all 24 display orders can be
+# precomputed; drawing one is an index pick instead of a sample() allocation
+_OPTION_PERMS = tuple(itertools.permutations(range(4)))
+
+_SEN_CODE = {"fresher": "F", "junior": "J", "middle": "M", "senior": "S"}
+# All 20 level labels precomputed so a render is one dict lookup, no f-string
+_LEVEL_STRINGS = {
+    (sen, lvl): f"{code}{lvl}" for sen, code in _SEN_CODE.items() for lvl in range(1, 6)
+}
+
+
 class AdaptiveTestingEngine:
 
     def __init__(self, questions_data):
-        self.questions_by_key = {}
+        pools = {}
         for q in questions_data:
-            key = f"{q['skill']}_{q['seniority']}_{q['level']}"
-            self.questions_by_key.setdefault(key, []).append(q)
-
-    def get_question(self, skill: str, seniority: str, level: int):
-        key = f"{skill}_{seniority}_{level}"
-        pool = self.questions_by_key.get(key, [])
-        return random.choice(pool) if pool else None
+            key = (q["skill"], q["seniority"], q["level"])
+            pools.setdefault(key, []).append(q)
+        # Freeze the pools: the engine is shared read-only across sessions,
+        # and choice() over a tuple skips list mutability bookkeeping
+        self.questions_by_key = {key: tuple(pool) for key, pool in pools.items()}
+
+    def get_question(self, skill: str, seniority: str, level: int, rng=random):
+        # Tuple keys hash the existing strings directly — no per-lookup
+        # f-string build
+        pool = self.questions_by_key.get((skill, seniority, level))
+        return rng.choice(pool) if pool else None
 
     @staticmethod
     def format_level_string(seniority: str, level: int):
-        reverse_map = {"fresher": "F", "junior": "J", "middle": "M", "senior": "S"}
-        return f"{reverse_map.get(seniority, '?')}{level}"
+        label = _LEVEL_STRINGS.get((seniority, level))
+        return label if label is not None else f"{_SEN_CODE.get(seniority, '?')}{level}"
+
+
+# The adaptive test is one DFA shared by all four starting seniorities.
+# Each state maps to (on_correct, on_wrong); a target is either the next
+# state name or a (result_label, failed) pair that terminates the test.
+# Nodes whose outcome depends on where the test started (because the
+# five-question budget runs out sooner) carry an "@<start>" suffix;
+# everything else — in particular all terminal subtrees — is shared.
+DFA = {
+    "start_fresher": ("F5@fresher", "F1"),
+    "start_junior": ("J5@junior", "J1@junior"),
+    "start_middle": ("M5@middle", "M1@middle"),
+    "start_senior": ("S5", "S1@senior"),
+    "F1": ("F2", ("LEVELF0", True)),
+    "F2": (("LEVELF2", False), ("LEVELF1", False)),
+    "F3": ("F5@junior", "F1"),
+    "F4": (("LEVELF4", False), ("LEVELF3", False)),
+    "F5@fresher": ("J3@fresher", "F4"),
+    "F5@junior": (("LEVELF5", False), "F4"),
+    "J1@fresher": ("J2", ("LEVELF5", False)),
+    "J1@junior": ("J2", "F3"),
+    "J1@middle": ("J2", ("LEVELJ0", True)),
+    "J2": (("LEVELJ2", False), ("LEVELJ1", False)),
+    "J3@fresher": ("J5@fresher", "J1@fresher"),
+    "J3@middle": ("J5@middle", "J1@middle"),
+    "J4": (("LEVELJ4", False), ("LEVELJ3", False)),
+    "J5@fresher": (("LEVELJ5", False), "J4"),
+    "J5@junior": ("M3@junior", "J4"),
+    "J5@middle": (("LEVELJ5", False), "J4"),
+    "M1@junior": ("M2", ("LEVELJ5", False)),
+    "M1@middle": ("M2", "J3@middle"),
+    "M1@senior": ("M2", ("LEVELM0", True)),
+    "M2": (("LEVELM2", False), ("LEVELM1", False)),
+    "M3@junior": ("M5@junior", "M1@junior"),
+    "M3@senior": ("M5@senior", "M1@senior"),
+    "M4": (("LEVELM4", False), ("LEVELM3", False)),
+    "M5@junior": (("LEVELM5", False), "M4"),
+    "M5@middle": ("S3", "M4"),
+    "M5@senior": (("LEVELM5", False), "M4"),
+    "S1@middle": ("S2", ("LEVELM5", False)),
+    "S1@senior": ("S2", "M3@senior"),
+    "S2": (("LEVELS2", False), ("LEVELS1", False)),
+    "S3": ("S5", "S1@middle"),
+    "S4": (("LEVELS4", False), ("LEVELS3", False)),
+    "S5": (("LEVELS5", False), "S4"),
+}
+
+# Seniority/level shown for a state, derived from its level code ("M4@x" → middle 4)
+_CODE_SEN = {code: sen for sen, code in _SEN_CODE.items()}
+_STATE_TO_SL = {
+    state: (_CODE_SEN[state[0]], int(state[1]))
+    for state in DFA
+    if not state.startswith("start_")
+}
 
 
 class AdaptiveTestSession:
 
+    __slots__ = (
+        "engine",
+        "skill",
+        "starting_seniority",
+        "current_seniority",
+        "current_level",
+        "answer_history",
+        "_current_question",
+        "option_order",
+        "is_finished",
+        "final_result",
+        "failed",
+        "path_state",
+        "level_code",
+        "_rng",
+    )
+
     def __init__(self, engine: AdaptiveTestingEngine, skill: str, start_seniority="middle"):
         self.engine = engine
         self.skill = skill
@@ -97,11 +297,18 @@ class AdaptiveTestSession:
         self.current_seniority = start_seniority
         self.current_level = 3  # Always start at level 3
         self.answer_history = []
-        self.question_history = []
+        # Only the question currently on screen is ever read back
+        self._current_question = None
+        self.option_order = None  # display-order permutation of option indices
         self.is_finished = False
         self.final_result: str | None = None
         self.failed = False
-        self.path_state = "initial"
+        self.path_state = f"start_{start_seniority}"
+        # Display label recomputed only when the level actually changes
+        self.level_code = AdaptiveTestingEngine.format_level_string(start_seniority, 3)
+        # Per-session RNG avoids contending on the global random lock
+        # when several Streamlit sessions answer concurrently
+        self._rng = random.Random()
 
 
     def _finish_test(self, label: str, failed: bool = False):
@@ -120,25 +327,29 @@ class AdaptiveTestSession:
     def get_next_question(self):
         if self.is_finished:
             return None
-        q = self.engine.get_question(self.skill, self.current_seniority, self.current_level)
+        q = self.engine.get_question(
+            self.skill, self.current_seniority, self.current_level, rng=self._rng
+        )
         if q is None:
             # No question available → abort gracefully
             self._finish_test("NO_QUESTION_AVAILABLE", failed=True)
             return None
 
-        shuffled_q = q.copy()
-        shuffled_options = q["options"].copy()
-        random.shuffle(shuffled_options)
-        shuffled_q["options"] = shuffled_options
-        self.question_history.append(shuffled_q)
-        return shuffled_q
+        # Shuffle by permuting indices; the shared question dict stays untouched
+        n_options = len(q["options"])
+        if n_options == 4:
+            self.option_order = self._rng.choice(_OPTION_PERMS)
+        else:
+            self.option_order = self._rng.sample(range(n_options), n_options)
+        self._current_question = q
+        return q
 
     def submit_answer(self, selected_idx: int):
-        if self.is_finished or not self.question_history:
+        if self.is_finished or self._current_question is None:
             return {"error": "No active question"}
 
-        question = self.question_history[-1]
-        correct = question["options"][selected_idx]["isAnswerKey"]
+        question = self._current_question
+        correct = question["options"][self.option_order[selected_idx]]["isAnswerKey"]
 
         self.answer_history.append(
             {
@@ -148,436 +359,106 @@ class AdaptiveTestSession:
             }
         )
 
-        # Dispatch to the correct branching algorithm
-        if self.starting_seniority == "fresher":
-            return self._update_state_after_answer_fresher(correct)
-        if self.starting_seniority == "junior":
-            return self._update_state_after_answer_junior(correct)
-        if self.starting_seniority == "middle":
-            return self._update_state_after_answer_middle(correct)
-        if self.starting_seniority == "senior":
-            return self._update_state_after_answer_senior(correct)
-        return {"error": "Invalid seniority"}
-
-    def _update_state_after_answer_middle(self, is_correct):
-
-        if len(self.answer_history) == 1:
-            if is_correct:
-                self.current_seniority = 'middle'
-                self.current_level = 5
-                self.path_state = 'M5'
-            else:
-                self.current_seniority = 'middle'
-                self.current_level = 1
-                self.path_state = 'M1'
-
-        # Q2 – M5 hoặc M1
-        elif len(self.answer_history) == 2:
-            if self.path_state == 'M5':
-                if is_correct:
-                    self.current_seniority = 'senior'
-                    self.current_level = 3
-                    self.path_state = 'S3'
-                else:
-                    self.current_seniority = 'middle'
-                    self.current_level = 4
-                    self.path_state = 'M4'
-            elif self.path_state == 'M1':
-                if is_correct:
-                    self.current_seniority = 'middle'
-                    self.current_level = 2
-                    self.path_state = 'M2'
-                else:
-                    self.current_seniority = 'junior'
-                    self.current_level = 3
-                    self.path_state = 'J3'
-
-        # Q3 – M2 / M4 / S3 / J3
-        elif len(self.answer_history) == 3:
-            if self.path_state == 'M2':
-                if is_correct:
-                    self._finish_test("LEVELM2")
-                else:
-                    self._finish_test("LEVELM1")
-                return self._get_result()
-            elif self.path_state == 'M4':
-                if is_correct:
-                    self._finish_test("LEVELM4")
-                else:
-                    self._finish_test("LEVELM3")
-                return self._get_result()
-            elif self.path_state == 'S3':
-                if is_correct:
-                    self.current_seniority = 'senior'
-                    self.current_level = 5
-                    self.path_state = 'S5'
-                else:
-                    self.current_seniority = 'senior'
-                    self.current_level = 1
-                    self.path_state = 'S1'
-            elif self.path_state == 'J3':
-                if is_correct:
-                    self.current_seniority = 'junior'
-                    self.current_level = 5
-                    self.path_state = 'J5'
-                else:
-                    self.current_seniority = 'junior'
-                    self.current_level = 1
-                    self.path_state = 'J1'
-
-        # Q4 – S5 / S1 / J5 / J1
-        elif len(self.answer_history) == 4:
-            if self.path_state == 'S5':
-                if is_correct:
-                    self._finish_test("LEVELS5")
-                else:
-                    self.current_seniority = 'senior'
-                    self.current_level = 4
-                    self.path_state = 'S4'
-            elif self.path_state == 'S1':
-                if is_correct:
-                    self.current_seniority = 'senior'
-                    self.current_level = 2
-                    self.path_state = 'S2'
-                else:
-                    self._finish_test("LEVELM5")
-                return self._get_result()
-            elif self.path_state == 'J5':
-                if is_correct:
-                    self._finish_test("LEVELJ5")
-                else:
-                    self.current_seniority = 'junior'
-                    self.current_level = 4
-                    self.path_state = 'J4'
-            elif self.path_state == 'J1':
-                if is_correct:
-                    self.current_seniority = 'junior'
-                    self.current_level = 2
-                    self.path_state = 'J2'
-                else:
-                    self._finish_test("LEVELJ0", failed=True)
-                return self._get_result()
-
-        # Q5 – S4 / S2 / J4 / J2
-        elif len(self.answer_history) == 5:
-            if self.path_state == 'S4':
-                if is_correct:
-                    self._finish_test("LEVELS4")
-                else:
-                    self._finish_test("LEVELS3")
-            elif self.path_state == 'S2':
-                if is_correct:
-                    self._finish_test("LEVELS2")
-                else:
-                    self._finish_test("LEVELS1")
-            elif self.path_state == 'J4':
-                if is_correct:
-                    self._finish_test("LEVELJ4")
-                else:
-                    self._finish_test("LEVELJ3")
-            elif self.path_state == 'J2':
-                if is_correct:
-                    self._finish_test("LEVELJ2")
-                else:
-                    self._finish_test("LEVELJ1")
+        # Single table lookup instead of walking a per-seniority branch ladder
+        node = DFA.get(self.path_state)
+        if node is None:
+            return {"error": "Invalid seniority"}
 
-        return self._get_result()
-
-
-    def _update_state_after_answer_senior(self, is_correct):
-        """
-        Cập nhật trạng thái bài test sau mỗi câu trả lời,
-        theo cây nhánh: bắt đầu từ S3, rồi xuống S1, rồi M3 nếu cần.
-        """
-        if len(self.answer_history) == 1:  # Q1: S3
-            if is_correct:
-                self.current_seniority = 'senior'
-                self.current_level = 5
-                self.path_state = 'S5'
-            else:
-                self.current_seniority = 'senior'
-                self.current_level = 1
-                self.path_state = 'S1'
-
-        elif len(self.answer_history) == 2:
-            if self.path_state == 'S5':
-                if is_correct:
-                    self._finish_test("LEVELS5")
-                else:
-                    self.current_seniority = 'senior'
-                    self.current_level = 4
-                    self.path_state = 'S4'
-            elif self.path_state == 'S1':
-                if is_correct:
-                    self.current_seniority = 'senior'
-                    self.current_level = 2
-                    self.path_state = 'S2'
-                else:
-                    self.current_seniority = 'middle'
-                    self.current_level = 3
-                    self.path_state = 'M3'
-
-        elif len(self.answer_history) == 3:
-            if self.path_state == 'S4':
-                if is_correct:
-                    self._finish_test("LEVELS4")
-                else:
-                    self._finish_test("LEVELS3")
-                return self._get_result()
-            elif self.path_state == 'S2':
-                if is_correct:
-                    self._finish_test("LEVELS2")
-                else:
-                    self._finish_test("LEVELS1")
-                return self._get_result()
-            elif self.path_state == 'M3':
-                if is_correct:
-                    self.current_seniority = 'middle'
-                    self.current_level = 5
-                    self.path_state = 'M5'
-                else:
-                    self.current_seniority = 'middle'
-                    self.current_level = 1
-                    self.path_state = 'M1'
-
-        elif len(self.answer_history) == 4:
-            if self.path_state == 'M5':
-                if is_correct:
-                    self._finish_test("LEVELM5")
-                else:
-                    self.current_seniority = 'middle'
-                    self.current_level = 4
-                    self.path_state = 'M4'
-            elif self.path_state == 'M1':
-                if is_correct:
-                    self.current_seniority = 'middle'
-                    self.current_level = 2
-                    self.path_state = 'M2'
-                else:
-                    self._finish_test("LEVELM0", failed=True)
-
-        elif len(self.answer_history) == 5:
-            if self.path_state == 'M4':
-                if is_correct:
-                    self._finish_test("LEVELM4")
-                else:
-                    self._finish_test("LEVELM3")
-            elif self.path_state == 'M2':
-                if is_correct:
-                    self._finish_test("LEVELM2")
-                else:
-                    self._finish_test("LEVELM1")
+        target = node[0] if correct else node[1]
+        if isinstance(target, tuple):
+            self._finish_test(*target)
+        else:
+            self.path_state = target
+            self.current_seniority, self.current_level = _STATE_TO_SL[target]
+            self.level_code = _LEVEL_STRINGS[(self.current_seniority, self.current_level)]
 
         return self._get_result()
 
 
-    def _update_state_after_answer_fresher(self, is_correct):
-        if len(self.answer_history) == 1:  # Q1: F3
-            if is_correct:
-                self.current_seniority = 'fresher'
-                self.current_level = 5
-                self.path_state = 'F5'
-            else:
-                self.current_seniority = 'fresher'
-                self.current_level = 1
-                self.path_state = 'F1'
-
-        elif len(self.answer_history) == 2:
-            if self.path_state == 'F5':
-                if is_correct:
-                    self.current_seniority = 'junior'
-                    self.current_level = 3
-                    self.path_state = 'J3'
-                else:
-                    self.current_seniority = 'fresher'
-                    self.current_level = 4
-                    self.path_state = 'F4'
-            elif self.path_state == 'F1':
-                if is_correct:
-                    self.current_seniority = 'fresher'
-                    self.current_level = 2
-                    self.path_state = 'F2'
-                else:
-                    self._finish_test("LEVELF0", failed=True)
-                    return self._get_result()
-
-        elif len(self.answer_history) == 3:
-            if self.path_state == 'F4':
-                if is_correct:
-                    self._finish_test("LEVELF4")
-                else:
-                    self._finish_test("LEVELF3")
-                return self._get_result()
-            elif self.path_state == 'F2':
-                if is_correct:
-                    self._finish_test("LEVELF2")
-                else:
-                    self._finish_test("LEVELF1")
-                return self._get_result()
-            elif self.path_state == 'J3':
-                if is_correct:
-                    self.current_seniority = 'junior'
-                    self.current_level = 5
-                    self.path_state = 'J5'
-                else:
-                    self.current_seniority = 'junior'
-                    self.current_level = 1
-                    self.path_state = 'J1'
-
-        elif len(self.answer_history) == 4:
-            if self.path_state == 'J5':
-                if is_correct:
-                    self._finish_test("LEVELJ5")
-                else:
-                    self.current_seniority = 'junior'
-                    self.current_level = 4
-                    self.path_state = 'J4'
-            elif self.path_state == 'J1':
-                if is_correct:
-                    self.current_seniority = 'junior'
-                    self.current_level = 2
-                    self.path_state = 'J2'
-                else:
-                    self._finish_test("LEVELF5")
-
-        elif len(self.answer_history) == 5:
-            if self.path_state == 'J4':
-                if is_correct:
-                    self._finish_test("LEVELJ4")
-                else:
-                    self._finish_test("LEVELJ3")
-            elif self.path_state == 'J2':
-                if is_correct:
-                    self._finish_test("LEVELJ2")
-                else:
-                    self._finish_test("LEVELJ1")
-
-        return self._get_result()
+def _stage_question(session: "AdaptiveTestSession", skill: str):
+    # Format the markdown once, when the question is drawn, so renders
+    # (including fragment redraws) do no hashing or formatting at all
+    q = session.get_next_question()
+    st.session_state["question"] = q
+    st.session_state["question_md"] = (
+        format_question_cached(q["question"], _LANG_MAP.get(skill, "text"))
+        if q is not None
+        else None
+    )
 
 
+def _on_answer(session: "AdaptiveTestSession", skill: str, question_id: str):
+    # Runs as a widget callback, before the next (fragment) run starts,
+    # so one run renders the outcome — no explicit st.rerun needed
+    current = session._current_question
+    if current is None or current["id"] != question_id:
+        # Stale submit for a form that has already been replaced
+        return
+    choice = st.session_state.get(f"radio_{skill}_{question_id}")
+    if choice is None:
+        # Submitted without picking an option; keep the question up
+        st.session_state["last_feedback"] = ("warning", "Hãy chọn một đáp án trước khi trả lời.")
+        return
+    result = session.submit_answer(choice)
+    if result.get("answer_history"):
+        if result["answer_history"]["is_correct"]:
+            st.session_state["last_feedback"] = ("success", "✅ ĐÚNG")
+        else:
+            st.session_state["last_feedback"] = ("error", "❌ SAI")
+    if not result["is_finished"]:
+        _stage_question(session, skill)
+
+
+@st.fragment
+def render_question(session: "AdaptiveTestSession", current_skill: str):
+    # Answer clicks rerun only this fragment; the rest of the script
+    # (init, summary, save logic) is skipped until the test finishes.
+    if session.is_finished:
+        # The callback finished the test; switch screens with a full rerun
+        st.rerun(scope="app")
 
-    def _update_state_after_answer_junior(self, is_correct):
-        if len(self.answer_history) == 1:
-            if is_correct:
-                self.current_seniority = 'junior'
-                self.current_level = 5
-                self.path_state = 'J5'
-            else:
-                self.current_seniority = 'junior'
-                self.current_level = 1
-                self.path_state = 'J1'
-
-        elif len(self.answer_history) == 2:
-            if self.path_state == 'J5':
-                if is_correct:
-                    self.current_seniority = 'middle'
-                    self.current_level = 3
-                    self.path_state = 'M3'
-                else:
-                    self.current_seniority = 'junior'
-                    self.current_level = 4
-                    self.path_state = 'J4'
-            elif self.path_state == 'J1':
-                if is_correct:
-                    self.current_seniority = 'junior'
-                    self.current_level = 2
-                    self.path_state = 'J2'
-                else:
-                    self.current_seniority = 'fresher'
-                    self.current_level = 3
-                    self.path_state = 'F3'
-
-        elif len(self.answer_history) == 3:
-            if self.path_state == 'J2':
-                if is_correct:
-                    self._finish_test("LEVELJ2")
-                else:
-                    self._finish_test("LEVELJ1")
-                return self._get_result()
-            elif self.path_state == 'J4':
-                if is_correct:
-                    self._finish_test("LEVELJ4")
-                else:
-                    self._finish_test("LEVELJ3")
-                return self._get_result()
-            elif self.path_state == 'M3':
-                if is_correct:
-                    self.current_seniority = 'middle'
-                    self.current_level = 5
-                    self.path_state = 'M5'
-                else:
-                    self.current_seniority = 'middle'
-                    self.current_level = 1
-                    self.path_state = 'M1'
-            elif self.path_state == 'F3':
-                if is_correct:
-                    self.current_seniority = 'fresher'
-                    self.current_level = 5
-                    self.path_state = 'F5'
-                else:
-                    self.current_seniority = 'fresher'
-                    self.current_level = 1
-                    self.path_state = 'F1'
-
-        elif len(self.answer_history) == 4:
-            if self.path_state == 'M5':
-                if is_correct:
-                    self._finish_test("LEVELM5")
-                else:
-                    self.current_seniority = 'middle'
-                    self.current_level = 4
-                    self.path_state = 'M4'
-            elif self.path_state == 'M1':
-                if is_correct:
-                    self.current_seniority = 'middle'
-                    self.current_level = 2
-                    self.path_state = 'M2'
-                else:
-                    self._finish_test("LEVELJ5")
-                return self._get_result()
-            elif self.path_state == 'F5':
-                if is_correct:
-                    self._finish_test("LEVELF5")
-                else:
-                    self.current_seniority = 'fresher'
-                    self.current_level = 4
-                    self.path_state = 'F4'
-            elif self.path_state == 'F1':
-                if is_correct:
-                    self.current_seniority = 'fresher'
-                    self.current_level = 2
-                    self.path_state = 'F2'
-                else:
-                    self._finish_test("LEVELF0", failed=True)
-                return self._get_result()
-
-        elif len(self.answer_history) == 5:
-            if self.path_state == 'M4':
-                if is_correct:
-                    self._finish_test("LEVELM4")
-                else:
-                    self._finish_test("LEVELM3")
-            elif self.path_state == 'M2':
-                if is_correct:
-                    self._finish_test("LEVELM2")
-                else:
-                    self._finish_test("LEVELM1")
-            elif self.path_state == 'F4':
-                if is_correct:
-                    self._finish_test("LEVELF4")
-                else:
-                    self._finish_test("LEVELF3")
-            elif self.path_state == 'F2':
-                if is_correct:
-                    self._finish_test("LEVELF2")
-                else:
-                    self._finish_test("LEVELF1")
+    question = st.session_state["question"]
 
-        return self._get_result()
+    # Feedback for the previous submit, shown on this natural render
+    feedback = st.session_state.pop("last_feedback", None)
+    if feedback is not None:
+        kind, message = feedback
+        getattr(st, kind)(message)
+
+    # The keyed container keeps its DOM identity across reruns of the same
+    # question, so the frontend only rebuilds when the question id changes
+    with st.container(key=f"q_{current_skill}_{question['id']}"):
+        st.subheader(f"Câu hỏi mức độ: {session.level_code} ({current_skill})")
+        st.markdown(st.session_state["question_md"], unsafe_allow_html=True)
+
+        # One form = one rerun per answer, instead of a widget event per
+        # option; keys derive from the stable question id so widget state
+        # never leaks between questions
+        with st.form(f"form_{current_skill}_{question['id']}"):
+            st.radio(
+                "Chọn đáp án:",
+                options=range(len(session.option_order)),
+                format_func=lambda i: question["options"][session.option_order[i]]["description"],
+                index=None,
+                key=f"radio_{current_skill}_{question['id']}",
+            )
+            st.form_submit_button(
+                "Trả lời",
+                on_click=_on_answer,
+                args=(session, current_skill, question["id"]),
+            )
 
 
 SKILLS = ["html", "css", "javascript", "react", "github"]
 
+_LANG_MAP = {
+    "html": "html",
+    "css": "css",
+    "javascript": "javascript",
+    "react": "javascript",
+    "github": "bash",          # ví dụ
+}
+
 st.set_page_config(page_title="Adaptive Multi‑Skill Quiz", layout="centered")
 st.title("Adaptive Question Demo - FWA.AT (Multi‑Skill)")
 st.markdown("<span style='color:green; font-weight:bold;'>Seniority: fresher, junior, middle, senior</span>", unsafe_allow_html=True)
@@ -585,12 +466,12 @@ st.markdown("<span style='color:green; font-weight:bold;'>Mỗi Seniority có 5
 st.markdown("<span style='color:green; font-weight:bold;'>Ví dụ: fresher cấp độ 1 là F1, fresher cấp độ 2 là F2, ...", unsafe_allow_html=True)
 st.markdown("<span style='color:green; font-weight:bold;'>Nếu trả lời đúng thì sẽ được tăng cấp (ví dụ: từ F3 lên F5), còn nếu trả lời sai thì sẽ bị giảm cấp (ví dụ: từ F5 xuống F4).", unsafe_allow_html=True)
 
-@st.cache_data
-def load_questions():
-    with open("merged_file.json", "r", encoding="utf-8") as f_in:
-        return json.load(f_in)
-
-questions_data = load_questions()
+@st.cache_resource
+def get_engine():
+    # cache_resource shares one parsed question bank + engine across all
+    # sessions instead of deep-copying the list per session like cache_data
+    with open("merged_file.json", "rb") as f_in:
+        return AdaptiveTestingEngine(orjson.loads(f_in.read()))
 
 
 if "initialized" not in st.session_state:
@@ -601,7 +482,6 @@ if "initialized" not in st.session_state:
     st.session_state["session"] = None
     st.session_state["question"] = None
     st.session_state["account"] = ""
-    st.session_state["engine"] = AdaptiveTestingEngine(questions_data)
     # st.session_state["result_saved"] = False
     st.session_state["result_saved"] = False      # còn dùng cho từng skill
     st.session_state["seniority"] = None          # <-- thêm
@@ -643,62 +523,29 @@ if st.session_state["session"] is None:
 
                 # Tạo phiên kiểm tra cho skill đầu tiên
                 session = AdaptiveTestSession(
-                    engine=st.session_state["engine"],
+                    engine=get_engine(),
                     skill=current_skill,
                     start_seniority=seniority,
                 )
                 st.session_state["session"] = session
-                st.session_state["question"] = session.get_next_question()
+                _stage_question(session, current_skill)
                 st.rerun()
 
     # ----- CASE 2: ĐÃ CÓ seniority & account (các skill tiếp theo) -----
     else:
         # Tự động tạo session, KHÔNG hiển thị input/nút
         session = AdaptiveTestSession(
-            engine=st.session_state["engine"],
+            engine=get_engine(),
             skill=current_skill,
             start_seniority=st.session_state["seniority"],
         )
         st.session_state["session"] = session
-        st.session_state["question"] = session.get_next_question()
+        _stage_question(session, current_skill)
         st.rerun()
 
 
 elif not st.session_state["session"].is_finished:
-    session: AdaptiveTestSession = st.session_state["session"]
-    question = st.session_state["question"]
-
-    level_str = AdaptiveTestingEngine.format_level_string(
-        session.current_seniority, session.current_level
-    )
-
-    st.subheader(f"Câu hỏi mức độ: {level_str} ({current_skill})")
-    lang_map = {
-        "html": "html",
-        "css": "css",
-        "javascript": "javascript",
-        "react": "javascript",
-        "github": "bash",          # ví dụ
-    }
-    lang = lang_map.get(current_skill, "text")
-
-    question_md = format_question_with_code(f"❓ {question['question']}", lang)
-    st.markdown(question_md, unsafe_allow_html=True)
-
-    for idx, option in enumerate(question["options"]):
-        if st.button(option["description"], key=f"opt_{idx}"):
-            result = session.submit_answer(idx)
-            if result.get("answer_history"):
-                if result["answer_history"]["is_correct"]:
-                    st.success("✅ ĐÚNG")
-                else:
-                    st.error("❌ SAI")
-
-            if not result["is_finished"]:
-                st.session_state["question"] = session.get_next_question()
-                st.rerun()
-            else:
-                st.rerun()
+    render_question(st.session_state["session"], current_skill)
 
 
 else:
@@ -710,28 +557,8 @@ else:
     st.write(f"Kết quả **{current_skill.upper()}**: **{result_label}**")
 
     if not st.session_state["result_saved"]:
-        account = st.session_state["account"]
-        final_result_dict = {
-            "account": account,
-            "skill": current_skill,
-            "final_result": result_label,
-            "failed": failed_flag,
-            "answer_history": session.answer_history,
-            "datetime": datetime.now().isoformat(),
-        }
-
-        # try:
-        #     local_path = save_result_to_file(account, current_skill, final_result_dict)
-        #     # st.info(f"💾 Đã lưu file cục bộ: {local_path}")
-        # except Exception as e:
-        #     st.error(f"❌ Lưu file cục bộ thất bại: {e}")
-
-        # try:
-        #     save_to_github(account, current_skill, result_label, session.answer_history, failed_flag)
-        # except Exception as e:
-        #     st.error(f"❌ Lưu GitHub thất bại: {e}")
-
-        # --- Tạo details cho từng câu ---
+        # Per-skill uploads are deliberately coalesced into the single
+        # end-of-run summary commit; only the label is kept here.
         st.session_state["results_per_skill"][current_skill] = result_label
         st.session_state["result_saved"] = True
 
@@ -743,7 +570,7 @@ else:
         st.rerun()
     else:
         st.header("Tổng hợp kết quả tất cả kỹ năng")
-        st.table(st.session_state["results_per_skill"])
+        st.table(results_table(tuple(st.session_state["results_per_skill"].items())))
             # --- Lưu tổng hợp chỉ 1 lần ---
         if not st.session_state["all_skills_saved"]:
             account = st.session_state["account"]
@@ -754,17 +581,26 @@ else:
                 "timestamp": datetime.now().isoformat(),
             }
 
-            try:
-                save_result_to_file(account, "allskills", summary)
-                save_to_github(account, "allskills", "COMPLETED", summary, False)
-                st.success("Đã lưu kết quả tổng hợp cho 5 kỹ năng!")
-            except Exception as e:
-                st.error(f"Lưu tổng hợp thất bại: {e}")
+            # Fire-and-forget: the worker thread does the disk/network I/O
+            # so the summary renders without waiting on GitHub.
+            save_q = get_save_queue()
+            run_ts = datetime.now(_HANOI_TZ).strftime("%Y%m%d_%H%M%S")
+            save_q.put(("summary", (account, "allskills", "COMPLETED", summary, False, run_ts)))
+            st.success("Đã lưu kết quả tổng hợp cho 5 kỹ năng!")
 
             st.session_state["all_skills_saved"] = True
+            st.session_state["save_run_ts"] = run_ts
+        else:
+            # Show where the background save actually landed once it finishes
+            saved_to = get_save_status().get(
+                (st.session_state["account"], st.session_state.get("save_run_ts"))
+            )
+            if saved_to == "github":
+                st.caption("Kết quả đã được đẩy lên GitHub.")
+            elif saved_to is not None:
+                st.caption(f"GitHub lỗi — kết quả được giữ ở file cục bộ: {saved_to}")
 
 
         if st.button("Làm lại từ đầu", key="restart_all"):
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
+            st.session_state.clear()
             st.rerun()